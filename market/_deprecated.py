@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+
+def apom_verbose(basket):
+    """Applies the APOM discount to the `basket`, if applicable.
+
+    .. deprecated:: 0.0.1
+        Use :func:`~market.market.apom` instead.
+        This takes only the basket, so unlike :func:`~market.market.apom` it
+        cannot be listed in :py:const:`~market.market.CURRENT_DISCOUNTS`.
+
+    :param list(str) basket: The basket to apply the APOM discount to.
+    :returns: The `basket` with the applicable discount applied.
+    :rtype: list(str)
+    """
+    om1_count = basket.count('OM1')
+    if om1_count < 1:
+        return basket
+    half_off_apples = min(om1_count, basket.count('AP1'))
+    discounted_basket = [None] * (len(basket) + half_off_apples)
+    length = 0
+    for item in basket:
+        discounted_basket[length] = item
+        length += 1
+        if item == 'AP1' and half_off_apples > 0:
+            discounted_basket[length] = 'APOM'
+            length += 1
+            half_off_apples -= 1
+    return discounted_basket
+
+
+def appl_verbose(basket):
+    """Applies the APPL discount to the `basket`, if applicable.
+
+    .. deprecated:: 0.0.1
+        Use :func:`~market.market.appl` instead.
+        This takes only the basket, so unlike :func:`~market.market.appl` it
+        cannot be listed in :py:const:`~market.market.CURRENT_DISCOUNTS`.
+
+    :param list(str) basket: The basket to apply the APPL discount to.
+    :returns: The `basket` with the applicable discount applied.
+    :rtype: list(str)
+    """
+    ap1_count = basket.count('AP1')
+    if ap1_count < 3:
+        return basket
+    discounted_basket = [None] * (len(basket) + ap1_count)
+    length = 0
+    for item in basket:
+        discounted_basket[length] = item
+        length += 1
+        if item == 'AP1':
+            discounted_basket[length] = 'APPL'
+            length += 1
+    return discounted_basket
+
+
+def bogo_verbose(basket):
+    """Applies the BOGO discount to the `basket`, if applicable.
+
+    .. deprecated:: 0.0.1
+        Use :func:`~market.market.bogo` instead.
+        This takes only the basket, so unlike :func:`~market.market.bogo` it
+        cannot be listed in :py:const:`~market.market.CURRENT_DISCOUNTS`.
+
+    :param list(str) basket: The basket to apply the BOGO discount to.
+    :returns: The `basket` with the applicable discount applied.
+    :rtype: list(str)
+    """
+    cf1_count = basket.count('CF1')
+    if cf1_count <= 1:
+        return basket
+    discounted_basket = [None] * (len(basket) + cf1_count // 2)
+    length = 0
+    eligible_for_discount = False
+    for item in basket:
+        discounted_basket[length] = item
+        length += 1
+        if item == 'CF1':
+            if eligible_for_discount:
+                discounted_basket[length] = 'BOGO'
+                length += 1
+                eligible_for_discount = False
+            else:
+                eligible_for_discount = True
+    return discounted_basket
+
+
+def chmk_verbose(basket):
+    """Applies the CHMK discount to the `basket`, if applicable.
+
+    .. deprecated:: 0.0.1
+        Use :func:`~market.market.chmk` instead.
+        This takes only the basket, so unlike :func:`~market.market.chmk` it
+        cannot be listed in :py:const:`~market.market.CURRENT_DISCOUNTS`.
+
+    :param list(str) basket: The basket to apply the CHMK discount to.
+    :returns: The `basket` with the applicable discount applied.
+    :rtype: list(str)
+    """
+    if 'CH1' not in basket:
+        return basket
+    try:
+        idx = basket.index('MK1')
+    except ValueError:
+        return basket
+    discounted_basket = basket.copy()
+    discounted_basket.insert(idx + 1, 'CHMK')
+    return discounted_basket
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+# cython imports
+from cpython.object cimport Py_EQ, PyObject_RichCompareBool
+
+
+def apply_discount_loop(list basket not None, object affected,
+                        object discount, object when):
+    """Returns the `basket` with `discount` added after each `affected` item
+    that `when` allows, which is the loop of
+    :func:`~market.market.apply_discount` compiled to C.
+
+    :param list(str) basket: The basket to apply `discount` to.
+    :param str affected: The product code that is affected by the trigger.
+    :param str discount: The product code representing the discount.
+    :param function when: The function to call to ultimately determine whether
+        or not to apply the discount.
+    :returns: The `basket` with the applicable discount applied.
+    :rtype: list(str)
+    :see: :func:`~market.market.apply_discount`
+    """
+    cdef Py_ssize_t seen_count = 0
+    cdef Py_ssize_t applied_count = 0
+    cdef list discounted_basket = []
+    cdef object item
+    # Iterating the list (rather than a fixed range) keeps this safe should
+    # `when` mutate `basket`.
+    for item in basket:
+        discounted_basket.append(item)
+        if PyObject_RichCompareBool(item, affected, Py_EQ):
+            seen_count += 1
+            if when(seen_count, applied_count):
+                discounted_basket.append(discount)
+                applied_count += 1
+    return discounted_basket
@@ -1,129 +1,127 @@
 # -*- coding: utf-8 -*-
+# stdlib imports
+import sys
 # stdlib froms
-from functools import reduce
-
-#: A mapping of product codes to their prices.
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
+# project froms
+try:
+    from market._market_core import apply_discount_loop
+except ImportError:
+    apply_discount_loop = None
+
+#: A mapping of product codes to their prices, in cents.
+#
+# Prices are kept in whole cents so that register amounts add up exactly.
 #
 # Product names have been omitted as they have no bearing on this module and
 # hopefully would be in a data store, in which case this module would ignore
 # them via e.g. ``SELECT`` ing certain columns or ``db.collection.find(...)``
 # ing certain fields.
 PRODUCT_PRICES = {
-    'CH1': 3.11,
-    'AP1': 6.00,
-    'CF1': 11.23,
-    'MK1': 4.75,
-    'OM1': 3.69
+    'CH1': 311,
+    'AP1': 600,
+    'CF1': 1123,
+    'MK1': 475,
+    'OM1': 369
 }
 
 #: A mapping of discount codes and the amount that they reduce the register
-#: total by, as a function of :py:const:`~market.market.PRODUCT_PRICES`.
+#: total by in cents, as a function of
+#: :py:const:`~market.market.PRODUCT_PRICES`.
 DISCOUNT_AMOUNTS = {
     'BOGO': -PRODUCT_PRICES['CF1'],
-    'APPL': 4.50 - PRODUCT_PRICES['AP1'],
+    'APPL': 450 - PRODUCT_PRICES['AP1'],
     'CHMK': -PRODUCT_PRICES['MK1'],
-    'APOM': -(PRODUCT_PRICES['AP1'] / 2.0)
+    'APOM': -(PRODUCT_PRICES['AP1'] // 2)
 }
 
 
-def apom(basket):
+def apom(basket, counts=None):
     """Applies the APOM discount to the `basket`, if applicable.
     The APOM discount is defined as:
 
         Purchase a bag of Oatmeal and get 50% off a bag of Apples.
 
     :param list(str) basket: The basket to apply the APOM discount to.
+    :param dict(str, int) counts: The product code counts of `basket`. These
+        are computed from `basket` when not given.
     :returns: The `basket` with the applicable discount applied.
     :rtype: list(str)
     :see: :py:const:`~market.market.DISCOUNT_AMOUNTS`
     :see: :func:`apply_discount`
     """
-    def when(_, applied_count):
-        return applied_count < basket.count('OM1')
-    return apply_discount('OM1', 1, 'AP1', 'APOM', when, basket)
+    if counts is None:
+        counts = Counter(basket)
+    return apply_discount('OM1', 1, 'AP1', 'APOM',
+                          _apom_when(counts.get('OM1', 0)), basket, counts)
 
 
-def apom_verbose(basket):
-    """Applies the APOM discount to the `basket`, if applicable.
-
-    .. deprecated:: 0.0.1
-        Use :func:`apom` instead.
+def _apom_when(om1_count):
+    """Returns the `when` of :func:`apom`, which discounts as many apples as
+    there are `om1_count` bags of oatmeal.
 
-    :param list(str) basket: The basket to apply the APOM discount to.
-    :returns: The `basket` with the applicable discount applied.
-    :rtype: list(str)
+    :param int om1_count: The number of OM1 in the basket.
+    :rtype: function
     """
-    if basket.count('OM1') < 1:
-        return basket
-    half_off_apples = min(basket.count('OM1'), basket.count('AP1'))
-    discounted_basket = []
-    for item in basket:
-        discounted_basket.append(item)
-        if item == 'AP1' and half_off_apples > 0:
-            discounted_basket.append('APOM')
-            half_off_apples -= 1
-    return discounted_basket
+    def when(_, applied_count):
+        return applied_count < om1_count
+    return when
 
 
-def appl(basket):
+def appl(basket, counts=None):
     """Applies the APPL discount to the `basket`, if applicable.
     The APPL discount is defined as:
 
         If you buy 3 or more bags of Apples, the price drops to $4.50.
 
     :param list(str) basket: The basket to apply the APPL discount to.
+    :param dict(str, int) counts: The product code counts of `basket`. These
+        are computed from `basket` when not given.
     :returns: The `basket` with the applicable discount applied.
     :rtype: list(str)
     :see: :py:const:`~market.market.DISCOUNT_AMOUNTS`
     :see: :func:`apply_discount`
     """
-    return apply_discount('AP1', 3, 'AP1', 'APPL', lambda *args: True, basket)
+    return apply_discount('AP1', 3, 'AP1', 'APPL', _appl_when, basket, counts)
 
 
-def appl_verbose(basket):
-    """Applies the APPL discount to the `basket`, if applicable.
+def _appl_when(seen_count, applied_count):
+    """The `when` of :func:`appl`, which discounts every apple."""
+    return True
 
-    .. deprecated:: 0.0.1
-        Use :func:`appl` instead.
 
-    :param list(str) basket: The basket to apply the APPL discount to.
-    :returns: The `basket` with the applicable discount applied.
-    :rtype: list(str)
-    """
-    if basket.count('AP1') < 3:
-        return basket
-    discounted_basket = []
-    for item in basket:
-        discounted_basket.append(item)
-        if item == 'AP1':
-            discounted_basket.append('APPL')
-    return discounted_basket
-
-
-def apply_discount(trigger, triggers_needed, affected, discount, when, basket):
+def apply_discount(trigger, triggers_needed, affected, discount, when, basket,
+                   counts=None):
     """Adds the given `discount` to the `basket`, if all preconditions are met,
     returning the new basket with discounts present.
 
     This is the function that all discounts are expected to call, hence the
-    deprecation of the ``*_verbose`` functions.
+    deprecation of the ``*_verbose`` functions. It updates `counts` with the
+    discount codes it adds, which the rest of
+    :py:const:`~market.market.CURRENT_DISCOUNTS` relies on.
 
     Example::
 
-        >>> market.PRODUCT_PRICES = {'FOO': 4, 'BAR': 2}
-        >>> market.DISCOUNT_AMOUNTS = {'BAZ': -3.50}
-        >>> def quux(basket):
+        >>> market.PRODUCT_PRICES = {'FOO': 400, 'BAR': 200}
+        >>> market.DISCOUNT_AMOUNTS = {'BAZ': -350}
+        >>> market.rebuild_code_amounts()
+        >>> def quux(basket, counts=None):
         ...     return market.apply_discount('BAR', 1, 'BAR', 'BAZ',
-        ...                                  lambda *args: True, basket)
+        ...                                  lambda *args: True, basket,
+        ...                                  counts)
         ...
         >>> setattr(market, 'quux', quux)
         >>> market.CURRENT_DISCOUNTS = [quux]
         >>> market.register(['FOO', 'FOO', 'BAR', 'BAR'])
-        [('FOO', 4), ('FOO', 4), ('BAR', 2), ('BAZ', -3.5), ('BAR', 2),
-         ('BAZ', -3.5)]
+        [('FOO', 400), ('FOO', 400), ('BAR', 200), ('BAZ', -350),
+         ('BAR', 200), ('BAZ', -350)]
         >>> market.register(['FOO', 'BAR'])
-        [('FOO', 4), ('BAR', 2), ('BAZ', -3.5)]
+        [('FOO', 400), ('BAR', 200), ('BAZ', -350)]
         >>> market.register(['BAR', 'FOO', 'BAR'])
-        [('BAR', 2), ('BAZ', -3.5), ('FOO', 4), ('BAR', 2), ('BAZ', -3.5)]
+        [('BAR', 200), ('BAZ', -350), ('FOO', 400), ('BAR', 200),
+         ('BAZ', -350)]
         >>>
 
     :param str trigger: The product code that potentially triggers a discount.
@@ -143,100 +141,98 @@ def apply_discount(trigger, triggers_needed, affected, discount, when, basket):
           context of :func:`apply_discount`
 
     :param list(str) basket: The basket to apply `discount` to.
+    :param dict(str, int) counts: The code counts of `basket`, used to check
+        for `triggers_needed`. These are computed from `basket` when not
+        given, and are updated with the `discount` codes that are added.
     :returns: The `basket` with the applicable discount applied.
     :rtype: list(str)
     """
-    if basket.count(trigger) < triggers_needed:
+    if counts is None:
+        counts = Counter(basket)
+    if counts.get(trigger, 0) < triggers_needed:
         return basket
-    discounted_basket = []
+    # The extension only takes exact lists, so anything else (list subclasses
+    # included) goes through the pure Python loop.
+    if apply_discount_loop is not None and type(basket) is list:
+        discounted_basket = apply_discount_loop(basket, affected, discount,
+                                                when)
+    else:
+        discounted_basket = _apply_discount_loop(basket, affected, discount,
+                                                 when)
+    # Keep the counts true for the discounted basket, so that a discount
+    # chained after this one can be triggered by the codes added here.
+    counts[discount] = (counts.get(discount, 0) + len(discounted_basket) -
+                        len(basket))
+    return discounted_basket
+
+
+def _apply_discount_loop(basket, affected, discount, when):
+    """Returns the `basket` with `discount` added after each `affected` item
+    that `when` allows.
+
+    :see: :func:`apply_discount`
+    """
+    # At most one discount follows each item. The counts are not relied on to
+    # bound this any tighter, since they may be given by the caller.
+    discounted_basket = [None] * (2 * len(basket))
+    length = 0
     seen_count = 0
     applied_count = 0
     for item in basket:
-        discounted_basket.append(item)
+        discounted_basket[length] = item
+        length += 1
         if item == affected:
             seen_count += 1
             if when(seen_count, applied_count):
-                discounted_basket.append(discount)
+                discounted_basket[length] = discount
+                length += 1
                 applied_count += 1
+    del discounted_basket[length:]
     return discounted_basket
 
 
-def bogo(basket):
+def bogo(basket, counts=None):
     """Applies the BOGO discount to the `basket`, if applicable.
     The BOGO discount is defined as:
 
         Buy-One-Get-One-Free Special on Coffee. (Unlimited)
 
     :param list(str) basket: The basket to apply the BOGO discount to.
+    :param dict(str, int) counts: The product code counts of `basket`. These
+        are computed from `basket` when not given.
     :returns: The `basket` with the applicable discount applied.
     :rtype: list(str)
     :see: :py:const:`~market.market.DISCOUNT_AMOUNTS`
     :see: :func:`apply_discount`
     """
-    def when(seen_count, _):
-        return seen_count % 2 == 0
-    return apply_discount('CF1', 2, 'CF1', 'BOGO', when, basket)
+    return apply_discount('CF1', 2, 'CF1', 'BOGO', _bogo_when, basket, counts)
 
 
-def bogo_verbose(basket):
-    """Applies the BOGO discount to the `basket`, if applicable.
-
-    .. deprecated:: 0.0.1
-        Use :func:`bogo` instead.
-
-    :param list(str) basket: The basket to apply the BOGO discount to.
-    :returns: The `basket` with the applicable discount applied.
-    :rtype: list(str)
-    """
-    if basket.count('CF1') <= 1:
-        return basket
-    discounted_basket = []
-    eligible_for_discount = False
-    for item in basket:
-        discounted_basket.append(item)
-        if item == 'CF1':
-            if eligible_for_discount:
-                discounted_basket.append('BOGO')
-                eligible_for_discount = False
-            else:
-                eligible_for_discount = True
-    return discounted_basket
+def _bogo_when(seen_count, _):
+    """The `when` of :func:`bogo`, which discounts every second coffee."""
+    return seen_count % 2 == 0
 
 
-def chmk(basket):
+def chmk(basket, counts=None):
     """Applies the CHMK discount to the `basket`, if applicable.
     The CHMK discount is defined as:
 
         Purchase a box of Chai and get milk free. (Limit 1)
 
     :param list(str) basket: The basket to apply the CHMK discount to.
+    :param dict(str, int) counts: The product code counts of `basket`. These
+        are computed from `basket` when not given.
     :returns: The `basket` with the applicable discount applied.
     :rtype: list(str)
     :see: :py:const:`~market.market.DISCOUNT_AMOUNTS`
     :see: :func:`apply_discount`
     """
-    def when(_, applied_count):
-        return applied_count < 1
-    return apply_discount('CH1', 1, 'MK1', 'CHMK', when, basket)
+    return apply_discount('CH1', 1, 'MK1', 'CHMK', _chmk_when, basket, counts)
 
 
-def chmk_verbose(basket):
-    """Applies the CHMK discount to the `basket`, if applicable.
-
-    .. deprecated:: 0.0.1
-        Use :func:`chmk` instead.
-
-    :param list(str) basket: The basket to apply the CHMK discount to.
-    :returns: The `basket` with the applicable discount applied.
-    :rtype: list(str)
-    """
-    if basket.count('CH1') < 1:
-        return basket
-    discounted_basket = basket.copy()
-    if 'MK1' in basket:
-        idx = basket.index('MK1')
-        discounted_basket.insert(idx + 1, 'CHMK')
-    return discounted_basket
+def _chmk_when(_, applied_count):
+    """The `when` of :func:`chmk`, which discounts the first milk only."""
+    return applied_count < 1
 
 
 #: A list of currently-applicable discounts of the form `list(function)`.
@@ -248,25 +244,307 @@ def chmk_verbose(basket):
 #: This would make it so the unlimited buy-one-get-one-free special on coffee
 #: and the purchase a bag of oatmeal and get 50% off a bag of apples discount
 #: are applied during :func:`~market.market.register`.
+#:
+#: Each discount is called with the basket and its product code counts, e.g.
+#: ``bogo(basket, counts)``, so that the basket is only counted once. The same
+#: counts are passed along the whole chain, so a discount must keep them true
+#: for the basket it returns: :func:`~market.market.apply_discount` does so
+#: for the codes it adds, but a discount that adds or removes codes any other
+#: way has to update `counts` itself, or later discounts will not see those
+#: codes. The one-argument ``*_verbose`` discounts cannot be listed here.
 CURRENT_DISCOUNTS = [bogo, appl, chmk, apom]
 
+(_CH1, _AP1, _CF1, _MK1, _OM1, _BOGO, _APPL, _CHMK, _APOM) = range(9)
+
+#: A mapping of product and discount codes to the small integers that
+#: :func:`_build_register` works with, so that a basket can be held as one
+#: byte per code in a `bytearray` instead of a list of `str`.
+CODE_IDS = {
+    'CH1': _CH1,
+    'AP1': _AP1,
+    'CF1': _CF1,
+    'MK1': _MK1,
+    'OM1': _OM1,
+    'BOGO': _BOGO,
+    'APPL': _APPL,
+    'CHMK': _CHMK,
+    'APOM': _APOM
+}
+
+_CODES_BY_ID = tuple(sorted(CODE_IDS, key=CODE_IDS.get))
+
+#: The discounts that :func:`_build_register` applies in a single pass over the
+#: basket, in the same order that :func:`~market.market.register` would chain
+#: them.
+_FUSED_DISCOUNTS = (bogo, appl, chmk, apom)
+
+
+def _lines_by_id(code_lines):
+    """Returns the register line of every code in :py:const:`CODE_IDS`,
+    indexed by id, so that the single-pass register can look lines up by id.
+
+    :param dict(str, tuple(str, int)) code_lines: The register line of all
+        product and discount codes.
+    :returns: The register lines by id, or `None` if a code has no amount.
+    :rtype: tuple(tuple(str, int))
+    """
+    try:
+        return tuple(map(code_lines.__getitem__, _CODES_BY_ID))
+    except KeyError:
+        return None
+
+
+def _build_register(ids, lines_by_id):
+    """Returns a register for the given basket `ids` with the
+    :py:const:`_FUSED_DISCOUNTS` applied, in one pass over `ids`.
+
+    The register lines are identical to chaining :func:`bogo`, :func:`appl`,
+    :func:`chmk` and :func:`apom`, including the position of each discount
+    code, without creating the intermediate basket of each discount.
+
+    :param bytearray ids: The basket to create a register from, as
+        :py:const:`CODE_IDS`.
+    :param tuple(tuple(str, int)) lines_by_id: The register line of each
+        id, as returned by :func:`_lines_by_id`.
+    :returns: The basket with all amounts associated to their codes.
+    :rtype: tuple(tuple(str, int))
+    :see: :func:`_sweep`
+    :see: :func:`_sweep_predicated`
+    """
+    # Counting a single byte value of a bytearray is a fast search over the
+    # buffer, unlike array.count, which compares every id as an int object.
+    counts = (ids.count(_AP1), ids.count(_OM1), ids.count(_CH1))
+    # Each AP1 can be followed by both APOM and APPL, which bounds the
+    # discounted basket at three codes per item, plus the one spare slot that
+    # _sweep_predicated may store to past the last item.
+    discounted = bytearray(3 * len(ids) + 1)
+    length = _discount_sweep(ids, discounted, *counts)
+    # A memoryview slice reads the discounted ids in place, without copying
+    # them out of the buffer first.
+    return tuple(map(lines_by_id.__getitem__,
+                     memoryview(discounted)[:length]))
+
+
+def _sweep(ids, discounted, ap1_count, om1_count, ch1_count):
+    """Writes the basket `ids` with the :py:const:`_FUSED_DISCOUNTS` applied
+    to `discounted`, returning the number of ids written.
+
+    :param bytearray ids: The basket to apply the discounts to, as
+        :py:const:`CODE_IDS`.
+    :param bytearray discounted: The preallocated buffer to write the
+        discounted basket to.
+    :param int ap1_count: The number of AP1 in `ids`.
+    :param int om1_count: The number of OM1 in `ids`.
+    :param int ch1_count: The number of CH1 in `ids`.
+    :returns: The length of the discounted basket in `discounted`.
+    :rtype: int
+    """
+    appl_applies = ap1_count >= 3
+    chmk_applies = ch1_count >= 1
+    cf1_seen = 0
+    apom_applied = 0
+    length = 0
+    for item in ids:
+        discounted[length] = item
+        length += 1
+        if item == _CF1:
+            cf1_seen += 1
+            if cf1_seen % 2 == 0:
+                discounted[length] = _BOGO
+                length += 1
+        elif item == _AP1:
+            # Discounts that are chained later are inserted closer to the
+            # affected item, hence APOM before APPL.
+            if apom_applied < om1_count:
+                discounted[length] = _APOM
+                length += 1
+                apom_applied += 1
+            if appl_applies:
+                discounted[length] = _APPL
+                length += 1
+        elif item == _MK1 and chmk_applies:
+            discounted[length] = _CHMK
+            length += 1
+            chmk_applies = False
+    return length
+
+
+def _sweep_predicated(ids, discounted, ap1_count, om1_count, ch1_count):
+    """Writes the basket `ids` with the :py:const:`_FUSED_DISCOUNTS` applied
+    to `discounted`, returning the number of ids written, without branching on
+    the items of `ids`.
+
+    Every discount code is stored after each item and only kept by advancing
+    the length when its predicate holds, so `discounted` needs one slot more
+    than the discounted basket. This is what :func:`_compiled_sweep` compiles
+    with numba, so it only works with integers and buffers.
+
+    :param bytearray ids: The basket to apply the discounts to, as
+        :py:const:`CODE_IDS`.
+    :param bytearray discounted: The preallocated buffer to write the
+        discounted basket to.
+    :param int ap1_count: The number of AP1 in `ids`.
+    :param int om1_count: The number of OM1 in `ids`.
+    :param int ch1_count: The number of CH1 in `ids`.
+    :returns: The length of the discounted basket in `discounted`.
+    :rtype: int
+    :see: :func:`_sweep`
+    """
+    appl_applies = ap1_count >= 3
+    chmk_applies = ch1_count >= 1
+    cf1_seen = 0
+    apom_applied = 0
+    length = 0
+    for item in ids:
+        discounted[length] = item
+        length += 1
+        is_cf1 = item == _CF1
+        is_ap1 = item == _AP1
+        cf1_seen += is_cf1
+        discounted[length] = _BOGO
+        length += is_cf1 & (cf1_seen % 2 == 0)
+        apom_applies = is_ap1 & (apom_applied < om1_count)
+        discounted[length] = _APOM
+        length += apom_applies
+        apom_applied += apom_applies
+        discounted[length] = _APPL
+        length += is_ap1 & appl_applies
+        chmk_applied = (item == _MK1) & chmk_applies
+        discounted[length] = _CHMK
+        length += chmk_applied
+        # Only the first MK1 gets CHMK, which is exactly when both are set.
+        chmk_applies ^= chmk_applied
+    return length
+
+
+#: The smallest basket, in ids, that :func:`_discount_sweep` hands to the
+#: compiled sweep. Below this, calling into numba costs about as much as the
+#: interpreted sweep it would replace.
+_COMPILED_SWEEP_MIN_IDS = 20
+
+
+@lru_cache(maxsize=None)
+def _compiled_sweep():
+    """Returns :func:`_sweep_predicated` compiled with numba, or `None` when
+    numba is not installed.
+
+    numba is only imported the first time this is called, and the sweep is
+    compiled (or loaded from numba's cache) on its first call, so neither
+    slows down importing this module.
+
+    :rtype: function
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    # The predicated sweep only pays off once compiled; interpreted, its extra
+    # stores and arithmetic cost more than the branches they replace.
+    return njit(cache=True)(_sweep_predicated)
+
+
+def _discount_sweep(ids, discounted, ap1_count, om1_count, ch1_count):
+    """Writes the basket `ids` with the :py:const:`_FUSED_DISCOUNTS` applied
+    to `discounted`, returning the number of ids written.
+
+    Baskets of at least :py:const:`_COMPILED_SWEEP_MIN_IDS` ids go through
+    :func:`_compiled_sweep` when numba is installed, and all others through
+    :func:`_sweep`. The parameters are those of :func:`_sweep`.
+
+    :rtype: int
+    """
+    if len(ids) >= _COMPILED_SWEEP_MIN_IDS:
+        compiled_sweep = _compiled_sweep()
+        if compiled_sweep is not None:
+            return compiled_sweep(ids, discounted, ap1_count, om1_count,
+                                  ch1_count)
+    return _sweep(ids, discounted, ap1_count, om1_count, ch1_count)
+
+
+@lru_cache(maxsize=1024)
+def _register_cached(basket, discounts):
+    """Returns a register for the given `basket` with the `discounts` applied.
+
+    :param tuple(str) basket: The basket to create a register from.
+    :param tuple(function) discounts: The discounts to apply, in order.
+    :returns: The `basket` with all amounts associated to their codes.
+    :rtype: tuple(tuple(str, int))
+    :see: :func:`register`
+    """
+    # Without a line for every id, e.g. when the prices have been replaced,
+    # the discount chain raises for just the codes that are actually missing.
+    if discounts == _FUSED_DISCOUNTS and _LINES_BY_ID is not None:
+        try:
+            ids = bytearray(map(CODE_IDS.__getitem__, basket))
+        except KeyError:
+            # A product without an id, e.g. a price added at runtime, so the
+            # basket has to go through the discount chain instead.
+            pass
+        else:
+            return _build_register(ids, _LINES_BY_ID)
+    # The discounts are given the basket as a list, as register was given it.
+    basket = list(basket)
+    # apply_discount keeps the counts up to date as each discount adds its
+    # codes, so they hold for the basket every discount in the chain gets.
+    counts = Counter(basket)
+    for discount in discounts:
+        basket = discount(basket, counts)
+    return tuple(map(_CODE_LINES.__getitem__, basket))
+
+
+def rebuild_code_amounts():
+    """Rebuilds the code amounts that :func:`register` looks up, which must be
+    done after :py:const:`~market.market.PRODUCT_PRICES` or
+    :py:const:`~market.market.DISCOUNT_AMOUNTS` are changed. This also clears
+    the registers cached by :func:`register`.
+
+    Example::
+
+        >>> market.PRODUCT_PRICES['CH1'] = 325
+        >>> market.rebuild_code_amounts()
+        >>> market.register(['CH1'])
+        [('CH1', 325)]
+
+    :see: :func:`register`
+    """
+    global _CODE_LINES, _LINES_BY_ID
+    # Every register line of a code is the same immutable tuple, so the lines
+    # are paired up front and shared by all registers.
+    _CODE_LINES = {code: (code, amount) for (code, amount)
+                   in {**PRODUCT_PRICES, **DISCOUNT_AMOUNTS}.items()}
+    _LINES_BY_ID = _lines_by_id(_CODE_LINES)
+    _register_cached.cache_clear()
+
+
+rebuild_code_amounts()
+
 
 def register(basket):
     """Returns a register for the given `basket`, which is a representation of
     codes and their associated values.
 
+    Registers are cached per basket and :py:const:`CURRENT_DISCOUNTS`, so
+    re-registering the same basket does not apply the discounts again.
+
+    The code of each register line is the code as it is keyed in
+    :py:const:`~market.market.PRODUCT_PRICES` or
+    :py:const:`~market.market.DISCOUNT_AMOUNTS`, rather than the object in
+    `basket`, so codes that are `str` subclasses (e.g. a `str` enum) come
+    back as plain `str`. Likewise, baskets of equal codes, such as
+    ``[Code.CF1]`` and ``['CF1']``, share one cached register.
+
     Example::
 
         >>> market.register(['BAR', 'FOO', 'BAR'])
-        [('BAR', 2), ('BAZ', -3.5), ('FOO', 4), ('BAR', 2), ('BAZ', -3.5)]
+        [('BAR', 200), ('BAZ', -350), ('FOO', 400), ('BAR', 200),
+         ('BAZ', -350)]
 
     :param list(str) basket: The basket to create a register from.
     :returns: The `basket` with all amounts associated to their codes.
-    :rtype: list(tuple(str, float))
+    :rtype: list(tuple(str, int))
+    :see: :func:`rebuild_code_amounts`
     """
-    code_amounts = {**PRODUCT_PRICES, **DISCOUNT_AMOUNTS}
-    discounted = reduce(lambda acc, f: f(acc), CURRENT_DISCOUNTS, basket)
-    return [(code, code_amounts[code]) for code in discounted]
+    return list(_register_cached(tuple(basket), tuple(CURRENT_DISCOUNTS)))
 
 
 def total(register_lines):
@@ -274,15 +552,41 @@ def total(register_lines):
 
     Example::
 
-        >>> market.total([('FOO', 4), ('BAR', 2), ('BAZ', -3.5)]) == 2.50
-        True
+        >>> market.total([('FOO', 400), ('BAR', 200), ('BAZ', -350)])
+        2.5
 
 
     :param register_lines: The register lines.
-    :type register_lines: list(tuple(str, float))
-    :returns: The total of all amounts in `register_lines`, rounded to two
-        significant digits.
+    :type register_lines: list(tuple(str, int))
+    :returns: The total of all amounts in `register_lines`, in dollars.
     :rtype: float
     :see: :func:`register`
     """
-    return round(sum([amount for (_, amount) in register_lines]), 2)
+    # The amounts are whole cents, so their sum is exact and only the
+    # conversion to dollars rounds.
+    return sum(map(itemgetter(1), register_lines)) / 100
+
+
+#: The deprecated discounts that live in :py:mod:`market._deprecated`.
+_DEPRECATED = ('apom_verbose', 'appl_verbose', 'bogo_verbose', 'chmk_verbose')
+
+
+def __getattr__(name):
+    """Returns the deprecated discount `name` from
+    :py:mod:`market._deprecated`, so that module is only imported once a
+    deprecated discount is used.
+
+    :param str name: The name of the missing module attribute.
+    :raises AttributeError: If `name` is not a deprecated discount.
+    """
+    if name in _DEPRECATED:
+        from market import _deprecated
+        return getattr(_deprecated, name)
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module level __getattr__ (PEP 562) is only honoured from Python 3.7.
+    from market._deprecated import (apom_verbose, appl_verbose,  # noqa: F401
+                                    bogo_verbose, chmk_verbose)
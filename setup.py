@@ -3,7 +3,22 @@
 # stdlib imports
 import os
 # stdlib froms
-from distutils.core import setup
+from distutils.core import Extension, setup
+# third party froms
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    # The discounts fall back to pure Python without the extension.
+    ext_modules = []
+else:
+    ext_modules = cythonize([Extension('market._market_core',
+                                       ['market/_market_core.pyx'])])
+    # Optional, so that failing to compile the extension (say, for want of a
+    # C compiler) only warns and installs the pure Python fallback. This is
+    # set after cythonize, which does not carry it over to the extensions it
+    # returns.
+    for ext_module in ext_modules:
+        ext_module.optional = True
 # project froms
 from market import version
 
@@ -27,6 +42,7 @@ setup(
         'Programming Language :: Python :: 3.6'
     ),
     description="A basic shopping cart for the farmer's market",
+    ext_modules=ext_modules,
     license='MIT License',
     long_description=readme,
     name="Farmer's Market",
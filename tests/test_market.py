@@ -1,17 +1,102 @@
 # -*- coding: utf-8 -*-
 # stdlib imports
+import os
+import subprocess
+import sys
 import unittest
+# stdlib froms
+from collections import Counter
+from enum import Enum
+from functools import reduce
+from unittest import mock
 # project froms
 from market import market
 
 
 class MarketTestCase(unittest.TestCase):
+    # Baskets are shared, immutable tuples so that the cases are not rebuilt
+    # every time a test runs. Tests convert them to lists only where the code
+    # under test needs a list.
+    _APOM_CASES = (
+        ('OM1', 'AP1'),
+        ('OM1',),
+        ('AP1', 'CH1'),
+        ('CF1',)
+    )
+    _APPL_CASES = (
+        ('AP1', 'AP1', 'CH1', 'AP1'),
+        ('AP1', 'AP1'),
+        ('AP1', 'CH1'),
+        ('CF1',)
+    )
+    _BOGO_CASES = (
+        ('CF1', 'CF1', 'CF1', 'CF1'),
+        ('AP1', 'AP1'),
+        ('AP1', 'CH1'),
+        ('CF1',)
+    )
+    _CHMK_CASES = (
+        ('CH1', 'AP1', 'CF1', 'MK1'),
+        ('CH1', 'AP1', 'CF1', 'MK1', 'MK1'),
+        ('AP1', 'CH1'),
+        ('CF1',)
+    )
+    _REGISTER_CASES = (
+        (('MK1', 'AP1'), [('MK1', 475), ('AP1', 600)]),
+        ((), [])
+    )
+    _REGISTER_FUSED_CASES = (
+        ('CH1', 'AP1', 'CF1', 'MK1'),
+        ('CH1', 'MK1', 'CH1', 'MK1'),
+        ('OM1', 'AP1', 'AP1', 'OM1', 'AP1'),
+        ('CF1', 'AP1', 'CF1', 'CF1', 'AP1', 'CF1', 'AP1'),
+        ('MK1', 'OM1', 'CF1', 'AP1', 'CH1'),
+        ()
+    )
+    _SWEEP_CASES = (
+        ('CH1', 'MK1', 'CH1', 'MK1'),
+        ('OM1', 'AP1', 'AP1', 'OM1', 'AP1'),
+        ('CF1', 'AP1', 'CF1', 'CF1', 'AP1', 'CF1', 'MK1', 'AP1'),
+        ('AP1',),
+        ()
+    )
+    _TOTAL_CASES = (
+        (('MK1', 'AP1'), 10.75),
+        ((), 0.00)
+    )
+    _TOTAL_APOM_CASES = ((('OM1', 'AP1'), 6.69),)
+    _TOTAL_APOM_APPL_CASES = (
+        (('OM1', 'AP1', 'AP1', 'AP1'), 14.19),
+        (('OM1', 'AP1', 'AP1', 'OM1', 'AP1'), 14.88)
+    )
+    _TOTAL_APPL_CASES = (
+        (('AP1', 'AP1', 'CH1', 'AP1'), 16.61),
+        (('AP1', 'AP1', 'AP1', 'AP1'), 18.00)
+    )
+    _TOTAL_BOGO_CASES = (
+        (('CF1', 'CF1'), 11.23),
+        (('CF1', 'CF1', 'CF1', 'CF1'), 22.46)
+    )
+    _TOTAL_CHMK_CASES = (
+        (('CH1', 'AP1', 'CF1', 'MK1'), 20.34),
+        (('CH1', 'MK1', 'MK1'), 7.86),
+        (('CH1', 'MK1', 'CH1', 'MK1'), 10.97)
+    )
+
     def assert_cases(self, cases, func):
         """a small helper function for parameterizing test cases"""
         for (got, expected) in cases:
             with self.subTest(got=got, expected=expected):
                 func(expected, got)
 
+    def assert_not_imported(self, module):
+        """asserts that importing market.market does not import `module`"""
+        code = ('import sys; from market import market; '
+                'sys.exit({!r} in sys.modules)'.format(module))
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(0, subprocess.call([sys.executable, '-c', code],
+                                            cwd=root))
+
     def assert_basket_totals(self, basket_cases):
         """converts basket cases to totals by way of register then asserts"""
         results = [(market.total(market.register(basket)), expected)
@@ -24,16 +109,22 @@ class MarketTestCase(unittest.TestCase):
         expected = ['OM1', 'AP1', 'APOM']
         self.assertEqual(expected, market.apom(basket))
 
+    def test_apom_counts(self):
+        """apply APOM discount with precomputed counts"""
+        basket = ['OM1', 'AP1', 'AP1']
+        counts = {'OM1': 1, 'AP1': 2}
+        expected = ['OM1', 'AP1', 'APOM', 'AP1']
+        self.assertEqual(expected, market.apom(basket, counts))
+
+    def test_apom_counts_missing(self):
+        """apply APOM discount with counts that leave out OM1"""
+        basket = ['OM1', 'AP1']
+        self.assertEqual(basket, market.apom(basket, {'AP1': 1}))
+
     def test_apom_verbose(self):
         """apply APOM discount (deprecated)"""
-        cases = [
-            ['OM1', 'AP1'],
-            ['OM1'],
-            ['AP1', 'CH1'],
-            ['CF1']
-        ]
         results = [(market.apom_verbose(case), market.apom(case))
-                   for case in cases]
+                   for case in self._APOM_CASES]
         self.assert_cases(results, self.assertEqual)
 
     def test_appl(self):
@@ -44,16 +135,28 @@ class MarketTestCase(unittest.TestCase):
 
     def test_appl_verbose(self):
         """apply APPL discount (deprecated)"""
-        cases = [
-            ['AP1', 'AP1', 'CH1', 'AP1'],
-            ['AP1', 'AP1'],
-            ['AP1', 'CH1'],
-            ['CF1']
-        ]
         results = [(market.appl_verbose(case), market.appl(case))
-                   for case in cases]
+                   for case in self._APPL_CASES]
         self.assert_cases(results, self.assertEqual)
 
+    @unittest.skipIf(market.apply_discount_loop is None,
+                     'needs the Cython extension')
+    def test_apply_discount_loop(self):
+        """Cython discount loop matches the pure Python loop"""
+        results = [(market.apply_discount_loop(list(case), 'CF1', 'BOGO',
+                                               market._bogo_when),
+                    market._apply_discount_loop(list(case), 'CF1', 'BOGO',
+                                                market._bogo_when))
+                   for case in self._BOGO_CASES]
+        self.assert_cases(results, self.assertEqual)
+
+    def test_apply_discount_list_subclass(self):
+        """apply a discount to a list subclass"""
+        class Basket(list):
+            pass
+        expected = ['CF1', 'CF1', 'BOGO']
+        self.assertEqual(expected, market.bogo(Basket(['CF1', 'CF1'])))
+
     def test_bogo(self):
         """apply BOGO discount"""
         basket = ['CF1', 'CF1', 'CF1', 'CF1']
@@ -62,14 +165,8 @@ class MarketTestCase(unittest.TestCase):
 
     def test_bogo_verbose(self):
         """apply BOGO discount (deprecated)"""
-        cases = [
-            ['CF1', 'CF1', 'CF1', 'CF1'],
-            ['AP1', 'AP1'],
-            ['AP1', 'CH1'],
-            ['CF1']
-        ]
         results = [(market.bogo_verbose(case), market.bogo(case))
-                   for case in cases]
+                   for case in self._BOGO_CASES]
         self.assert_cases(results, self.assertEqual)
 
     def test_chmk(self):
@@ -80,71 +177,176 @@ class MarketTestCase(unittest.TestCase):
 
     def test_chmk_verbose(self):
         """apply CHMK discount (deprecated)"""
-        cases = [
-            ['CH1', 'AP1', 'CF1', 'MK1'],
-            ['CH1', 'AP1', 'CF1', 'MK1', 'MK1'],
-            ['AP1', 'CH1'],
-            ['CF1']
-        ]
+        # chmk_verbose copies the basket it is given, which takes a list.
+        cases = [list(case) for case in self._CHMK_CASES]
         results = [(market.chmk_verbose(case), market.chmk(case))
                    for case in cases]
         self.assert_cases(results, self.assertEqual)
 
+    @unittest.skipIf(sys.version_info < (3, 7), 'needs PEP 562')
+    def test_import_deprecated(self):
+        """the deprecated discounts are only imported once used"""
+        self.assert_not_imported('market._deprecated')
+
+    def test_import_numba(self):
+        """numba is only imported once a large basket is registered"""
+        self.assert_not_imported('numba')
+
+    def test_missing_attribute(self):
+        """unknown module attributes still raise AttributeError"""
+        with self.assertRaises(AttributeError):
+            market.nope
+
+    def test_rebuild_code_amounts(self):
+        """register picks up changed prices once rebuilt"""
+        basket = ['CH1', 'MK1']
+        self.addCleanup(market.rebuild_code_amounts)
+        with mock.patch.dict(market.PRODUCT_PRICES, {'CH1': 325}):
+            self.assertEqual(311, market.register(basket)[0][1])
+            market.rebuild_code_amounts()
+            self.assertEqual([('CH1', 325), ('MK1', 475), ('CHMK', -475)],
+                             market.register(basket))
+
     def test_register(self):
         """basic register with no discounts applied"""
         # Extended register testing is covered by all the total_* tests.
         # If there is a need to explicitly test more cases for register, that
         # can be revisited in the future.
-        cases = [
-            (['MK1', 'AP1'], [('MK1', 4.75), ('AP1', 6.00)]),
-            ([], [])
-        ]
         results = [(market.register(case), expected)
-                   for (case, expected) in cases]
+                   for (case, expected) in self._REGISTER_CASES]
+        self.assert_cases(results, self.assertEqual)
+
+    def test_register_cached(self):
+        """cached registers are not shared with callers"""
+        basket = ['CF1', 'CF1']
+        expected = [('CF1', 1123), ('CF1', 1123), ('BOGO', -1123)]
+        market.register(basket).append(('CH1', 311))
+        self.assertEqual(expected, market.register(basket))
+
+    def test_register_chained_trigger(self):
+        """register a discount triggered by another discount's code"""
+        def mug(basket, counts=None):
+            return market.apply_discount('BOGO', 1, 'CF1', 'MUG',
+                                         lambda *args: True, basket, counts)
+        basket = ['CF1', 'CF1']
+        expected = [('CF1', 1123), ('MUG', -100), ('CF1', 1123),
+                    ('MUG', -100), ('BOGO', -1123)]
+        self.addCleanup(market.rebuild_code_amounts)
+        with mock.patch.dict(market.DISCOUNT_AMOUNTS, {'MUG': -100}), \
+                mock.patch.object(market, 'CURRENT_DISCOUNTS',
+                                  [market.bogo, mug]):
+            market.rebuild_code_amounts()
+            self.assertEqual(expected, market.register(basket))
+
+    def test_register_counts_updated(self):
+        """a discount that updates the counts it adds to triggers later ones"""
+        def freecf(basket, counts=None):
+            if counts is None:
+                counts = Counter(basket)
+            if not counts.get('CH1', 0):
+                return basket
+            counts['CF1'] = counts.get('CF1', 0) + 1
+            return basket + ['CF1']
+        with mock.patch.object(market, 'CURRENT_DISCOUNTS',
+                               [freecf, market.bogo]):
+            register = market.register(['CH1', 'CF1'])
+        expected = [('CH1', 311), ('CF1', 1123), ('CF1', 1123),
+                    ('BOGO', -1123)]
+        self.assertEqual(expected, register)
+
+    def test_register_fused(self):
+        """single pass register matches chaining the current discounts"""
+        code_amounts = {**market.PRODUCT_PRICES, **market.DISCOUNT_AMOUNTS}
+        chain = [market.bogo, market.appl, market.chmk, market.apom]
+        results = []
+        for case in self._REGISTER_FUSED_CASES:
+            discounted = reduce(lambda acc, f: f(acc), chain, case)
+            expected = [(code, code_amounts[code]) for code in discounted]
+            results.append((market.register(case), expected))
+        self.assert_cases(results, self.assertEqual)
+
+    def test_register_str_subclass(self):
+        """register codes that are str subclasses, e.g. a str enum"""
+        Code = Enum('Code', {'CF1': 'CF1', 'MK1': 'MK1'}, type=str)
+        basket = [Code.CF1, Code.MK1]
+        expected = [('CF1', 1123), ('MK1', 475)]
+        # The register lines hold the codes of the amounts, which are plain
+        # str, so check the types as well as the (equal) values. Both the
+        # single-pass register and the discount chain are covered.
+        for discounts in (market.CURRENT_DISCOUNTS, [market.bogo]):
+            with mock.patch.object(market, 'CURRENT_DISCOUNTS', discounts):
+                register = market.register(basket)
+            self.assertEqual(expected, register)
+            self.assertEqual([str, str],
+                             [type(code) for (code, _) in register])
+
+    def test_register_unknown_code(self):
+        """register a product added at runtime alongside the discounts"""
+        basket = ['TE1', 'CF1', 'CF1']
+        expected = [('TE1', 100), ('CF1', 1123), ('CF1', 1123),
+                    ('BOGO', -1123)]
+        self.addCleanup(market.rebuild_code_amounts)
+        with mock.patch.dict(market.PRODUCT_PRICES, {'TE1': 100}):
+            market.rebuild_code_amounts()
+            self.assertEqual(expected, market.register(basket))
+
+    @unittest.skipIf(market._compiled_sweep() is None, 'needs numba')
+    def test_sweep_compiled(self):
+        """compiled sweep matches the branching sweep, within its buffer"""
+        # Out of bounds stores are not checked once compiled, so the buffer is
+        # followed by guard bytes that the sweep must leave alone.
+        guard = bytearray(b'\x7f' * 8)
+        results = []
+        for case in self._SWEEP_CASES:
+            ids = bytearray(market.CODE_IDS[code] for code in case)
+            counts = Counter(case)
+            args = (counts['AP1'], counts['OM1'], counts['CH1'])
+            size = 3 * len(ids) + 1
+            discounted = bytearray(size)
+            length = market._sweep(ids, discounted, *args)
+            compiled = bytearray(size) + guard
+            length_compiled = market._compiled_sweep()(ids, compiled, *args)
+            results.append(((compiled[:length_compiled], compiled[size:]),
+                            (discounted[:length], guard)))
+        self.assert_cases(results, self.assertEqual)
+
+    def test_sweep_predicated(self):
+        """branchless sweep matches the branching sweep"""
+        results = []
+        for case in self._SWEEP_CASES:
+            ids = bytearray(market.CODE_IDS[code] for code in case)
+            counts = Counter(case)
+            args = (counts['AP1'], counts['OM1'], counts['CH1'])
+            size = 3 * len(ids) + 1
+            discounted = bytearray(size)
+            length = market._sweep(ids, discounted, *args)
+            predicated = bytearray(size)
+            length_predicated = market._sweep_predicated(ids, predicated,
+                                                         *args)
+            results.append((predicated[:length_predicated],
+                            discounted[:length]))
         self.assert_cases(results, self.assertEqual)
 
     def test_total(self):
         """basic totals with no discounts applied"""
-        cases = [
-            (['MK1', 'AP1'], 10.75),
-            ([], 0.00)
-        ]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_CASES)
 
     def test_total_apom(self):
         """totals with only the APOM discount"""
-        cases = [(['OM1', 'AP1'], 6.69)]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_APOM_CASES)
 
     def test_total_apom_appl(self):
         """totals with the APOM and APPL discounts"""
-        cases = [
-            (['OM1', 'AP1', 'AP1', 'AP1'], 14.19),
-            (['OM1', 'AP1', 'AP1', 'OM1', 'AP1'], 14.88)
-        ]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_APOM_APPL_CASES)
 
     def test_total_appl(self):
         """totals with only the APPL discount"""
-        cases = [
-            (['AP1', 'AP1', 'CH1', 'AP1'], 16.61),
-            (['AP1', 'AP1', 'AP1', 'AP1'], 18.00)
-        ]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_APPL_CASES)
 
     def test_total_bogo(self):
         """totals with only the BOGO discount"""
-        cases = [
-            (['CF1', 'CF1'], 11.23),
-            (['CF1', 'CF1', 'CF1', 'CF1'], 22.46)
-        ]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_BOGO_CASES)
 
     def test_total_chmk(self):
         """totals with only the CHMK discount"""
-        cases = [
-            (['CH1', 'AP1', 'CF1', 'MK1'], 20.34),
-            (['CH1', 'MK1', 'MK1'], 7.86),
-            (['CH1', 'MK1', 'CH1', 'MK1'], 10.97)
-        ]
-        self.assert_basket_totals(cases)
+        self.assert_basket_totals(self._TOTAL_CHMK_CASES)